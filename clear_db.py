@@ -1,22 +1,4 @@
-
-# import and setup mongodb
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from pymongo.database import Database
-
-# load mongo db username and password from dotenv
-from dotenv import load_dotenv
-import os
-load_dotenv()
-
-client = MongoClient(
-    "mongodb://192.168.1.69:27017/", 
-    username=os.getenv("MONGO_USERNAME"),
-    password=os.getenv("MONGO_PASSWORD")
-)
-
-db = client["crypto_trading"]
-Collection = db["estimated_order_prices_history"]
+from db import Collection
 
 
 def clear_mongo():
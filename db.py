@@ -0,0 +1,20 @@
+# shared mongodb client so every module importing the price history collection uses one connection pool
+from pymongo import MongoClient
+
+# load mongo db username and password from dotenv
+from dotenv import load_dotenv
+import os
+load_dotenv()
+
+client = MongoClient(
+    "mongodb://192.168.1.69:27017/",
+    username=os.getenv("MONGO_USERNAME"),
+    password=os.getenv("MONGO_PASSWORD"),
+    maxPoolSize=10,
+    minPoolSize=1,
+)
+
+db = client["crypto_trading"]
+Collection = db["estimated_order_prices_history"]
+# most recent EstimatedOrderPriceHistoryEntry for each symbol, upserted on every fetch
+LatestPricesCollection = db["latest_prices"]
@@ -1,34 +1,51 @@
 from robinhood import EstimatedOrderPriceHistoryEntry, CryptoAPITrading
 from datetime import datetime
 from pprint import pprint
+from itertools import groupby
+import numpy as np
 
-# import and setup mongodb
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from pymongo.database import Database
-
-# load mongo db username and password from dotenv
-from dotenv import load_dotenv
-import os
-load_dotenv()
-
-client = MongoClient(
-    "mongodb://192.168.1.69:27017/", 
-    username=os.getenv("MONGO_USERNAME"),
-    password=os.getenv("MONGO_PASSWORD")
-)
-
-db = client["crypto_trading"]
-Collection = db["estimated_order_prices_history"]
+from db import Collection
 
 # function to read all EstimatedOrderPriceHistoryEntry from MongoDB
+# sorted by (symbol, timestamp) so the query walks the compound index created in setup_db.py
+# entries written by the collector are trusted, so they're built with model_construct() to skip validation
 def read_price_history() -> dict[str, list[EstimatedOrderPriceHistoryEntry]]:
+    cursor = Collection.find({}, projection={"_id": 0}, batch_size=10000).sort([("symbol", 1), ("timestamp", 1)])
+    entries = (EstimatedOrderPriceHistoryEntry.model_construct(**entry) for entry in cursor)
+    return {
+        symbol: list(group)
+        for symbol, group in groupby(entries, key=lambda entry: entry.symbol)
+    }
+
+# numpy dtype used for each column of the price history, keyed on the EstimatedOrderPriceHistoryEntry field type
+# mongo stores datetimes in UTC with millisecond precision. str fields (symbol, sides) are constant per
+# symbol so they're left out of the columns
+_COLUMN_DTYPES = {float: np.float64, datetime: "datetime64[ms]"}
+PRICE_HISTORY_COLUMNS = {
+    name: _COLUMN_DTYPES[field.annotation]
+    for name, field in EstimatedOrderPriceHistoryEntry.model_fields.items()
+    if field.annotation in _COLUMN_DTYPES
+}
+
+# function to read the price history as one numpy array per column for each symbol (struct of arrays)
+# so analysis like spreads and moving averages can be vectorized instead of looping over entries
+def read_price_history_columns() -> dict[str, dict[str, np.ndarray]]:
     price_history = {}
-    for entry in Collection.find():
-        entry = EstimatedOrderPriceHistoryEntry(**entry)
-        if entry.symbol not in price_history:
-            price_history[entry.symbol] = []
-        price_history[entry.symbol].append(entry)
+    projection = {name: 1 for name in PRICE_HISTORY_COLUMNS} | {"_id": 0}
+    for symbol in Collection.distinct("symbol"):
+        n = Collection.count_documents({"symbol": symbol})
+        columns = {name: np.empty(n, dtype=dtype) for name, dtype in PRICE_HISTORY_COLUMNS.items()}
+        cursor = Collection.find({"symbol": symbol}, projection=projection, batch_size=10000).sort("timestamp", 1)
+        i = 0
+        for entry in cursor:
+            # entries written after the count was taken are left for the next read
+            if i == n:
+                break
+            for name, column in columns.items():
+                column[i] = entry[name]
+            i += 1
+        # trim in case entries were pruned by the TTL index after the count was taken
+        price_history[symbol] = {name: column[:i] for name, column in columns.items()}
     return price_history
 
 if __name__ == "__main__":
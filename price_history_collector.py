@@ -1,50 +1,73 @@
 from robinhood import EstimatedOrderPriceHistoryEntry, CryptoAPITrading
 from datetime import datetime
 from pprint import pprint
-
-# import and setup mongodb
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from pymongo.database import Database
-
-# load mongo db username and password from dotenv
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import os
-load_dotenv()
 
-client = MongoClient(
-    "mongodb://192.168.1.69:27017/", 
-    username=os.getenv("MONGO_USERNAME"),
-    password=os.getenv("MONGO_PASSWORD")
-)
+from pymongo import UpdateOne
+from pymongo.write_concern import WriteConcern
+import db
+
+# only print every fetched entry when DEBUG is set in the environment / .env
+DEBUG = os.getenv("DEBUG", "").lower().strip() in ("1", "true", "y", "yes")
 
-db = client["crypto_trading"]
-Collection = db["estimated_order_prices_history"]
+# use unacknowledged (w=0) writes on the insert path so inserts return as soon as the batch is sent.
+# losing the odd price tick is acceptable for this collection, but write errors (e.g. duplicate keys)
+# are not reported back
+Collection = db.Collection.with_options(write_concern=WriteConcern(w=0))
 
-# function to write EstimatedOrderPriceHistoryEntry to MongoDB
-def write_to_mongo(data: EstimatedOrderPriceHistoryEntry):
-    Collection.insert_one(data.dict())
+# function to write a batch of EstimatedOrderPriceHistoryEntry to MongoDB, appending them to the history
+# and upserting the latest entry per symbol. bulk_write is scoped to one collection, so this is one
+# round trip per collection for the whole batch rather than one per entry
+# ordered=False so one bad document doesn't abort the rest of the batch
+def write_to_mongo(data: list[EstimatedOrderPriceHistoryEntry]):
+    if not data:
+        return
+    Collection.insert_many([d.model_dump() for d in data], ordered=False)
+    # dump again rather than reusing the inserted docs, since insert_many adds an _id to each of them
+    # latest_prices keeps the default acknowledged write concern, since a dropped upsert would
+    # silently leave that symbol's latest row stale
+    db.LatestPricesCollection.bulk_write(
+        [UpdateOne({"symbol": d.symbol}, {"$set": d.model_dump()}, upsert=True) for d in data],
+        ordered=False,
+    )
 
+# uses the acknowledged collection so the delete has completed (or raised) before reporting success
 def clear_mongo():
-    Collection.delete_many({})
+    db.Collection.delete_many({})
     print("Cleared MongoDB")
 
 
 client = CryptoAPITrading()
 target_symbols = ["SHIB-USD", "DOGE-USD"]
+# one worker per symbol so every price fetch is in flight at the same time
+pool = ThreadPoolExecutor(max_workers=len(target_symbols))
 
 
 def fetch_and_record_current_prices():
-    for symbol in target_symbols:
-        estimated_order_price_history_entry = client.get_current_estimated_price(symbol)
-        print(f"Current estimated price for {symbol}")
-        pprint(estimated_order_price_history_entry.dict())
-        write_to_mongo(estimated_order_price_history_entry)
-        # confirm the order is in the database
-        # r = Collection.find_one({"symbol": symbol, "timestamp": estimated_order_price_history_entry.timestamp})
-        # if not r:
-        #     print("Failed to write to mongo")
-        #     return
+    # min_order_size never changes for a symbol, so resolve the trading pairs for every target symbol in one
+    # request up front. this is a no-op once they're cached, and any symbols still missing (e.g. because this
+    # request failed) are looked up individually by get_current_estimated_price
+    try:
+        client.prefetch_trading_pairs(*target_symbols)
+    except Exception as e:
+        print(f"Error prefetching trading pairs, falling back to per symbol lookups: {e}")
+    # fetch all symbols concurrently so latency is ~1 round trip instead of one per symbol
+    futures = {symbol: pool.submit(client.get_current_estimated_price, symbol) for symbol in target_symbols}
+    # one failed symbol shouldn't drop the entries fetched for the others
+    batch = []
+    for symbol, future in futures.items():
+        try:
+            estimated_order_price_history_entry = future.result()
+        except Exception as e:
+            print(f"Error fetching current estimated price for {symbol}: {e}")
+            continue
+        batch.append(estimated_order_price_history_entry)
+        if DEBUG:
+            print(f"Current estimated price for {symbol}")
+            pprint(estimated_order_price_history_entry.model_dump())
+    # flush every successfully fetched symbol for this tick in one batched write
+    write_to_mongo(batch)
 
 # def main():
 #     last_time_fetched = None
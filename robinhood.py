@@ -1,28 +1,39 @@
 import base64
 import datetime
-import json
-from typing import Any, Dict, Optional, List
+import orjson
+from typing import Any, Callable, Dict, Optional, List
+import functools
 import uuid
+import time
 import requests
-from nacl.signing import SigningKey
+from requests.adapters import HTTPAdapter
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from pprint import pprint
-from pydantic import BaseModel
-from diskcache import Cache
+from pydantic import BaseModel, model_validator
+import redis
 from dotenv import load_dotenv
 import os
-from dateutil import parser
-
-# setup cache
-cache = Cache("cache")
 
 # load environment variables
 load_dotenv()
 
+# setup redis cache, shared across every process / container running the collector
+# short timeouts so a hung redis raises (and falls back to an uncached call) instead of blocking
+redis_client = redis.Redis(
+    unix_socket_path=os.getenv("REDIS_SOCKET_PATH", "/tmp/redis.sock"),
+    socket_timeout=0.5,
+    socket_connect_timeout=0.5,
+)
+
 API_KEY = os.getenv("ROBINHOOD_API_KEY")
 BASE64_PRIVATE_KEY = os.getenv("ROBINHOOD_BASE64_PRIVATE_KEY")
 
 
 
+# NOTE: API payloads are parsed with model_validate, which runs in pydantic-core and coerces the string
+# encoded numbers and timestamps natively. The from_obj(s) classmethods below build models from already
+# validated objects, so they use model_construct() to skip validation entirely
+
 # make pydantic class for representing a trading pair
 # {'asset_code': 'BTC',
 # 'asset_increment': '0.000000010000000000',
@@ -43,19 +54,6 @@ class TradingPair(BaseModel):
     status: str
     symbol: str
 
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "TradingPair":
-        return cls(
-            asset_code=data["asset_code"],
-            asset_increment=float(data["asset_increment"]),
-            max_order_size=float(data["max_order_size"]),
-            min_order_size=float(data["min_order_size"]),
-            quote_code=data["quote_code"],
-            quote_increment=float(data["quote_increment"]),
-            status=data["status"],
-            symbol=data["symbol"],
-        )
-
 # make pydantic model for representing bid and ask estimates
 # ask:
 # [{'symbol': 'SHIB-USD', 'price': '0.00001945', 'quantity': '800', 'side': 'ask', 'ask_inclusive_of_buy_spread':
@@ -63,58 +61,70 @@ class TradingPair(BaseModel):
 # bid:
 # [{'symbol': 'SHIB-USD', 'price': '0.00001943', 'quantity': '800', 'side': 'bid', 'bid_inclusive_of_sell_spread': '0.00001933', 'sell_spread': '0.00514668', 'timestamp': '2024-11-09T06:15:05.54552805-05:00'}]
 
+# maps each side to its (price including spread, spread) keys in the API response
+_SPREAD_KEYS = {
+    "bid": ("bid_inclusive_of_sell_spread", "sell_spread"),
+    "ask": ("ask_inclusive_of_buy_spread", "buy_spread"),
+}
+
 class EstimatedOrderPrice(BaseModel):
     symbol: str
     price: float
     quantity: float
     side: str
+    # the API returns nanosecond precision timestamps with an offset. pydantic-core parses these natively,
+    # truncating to microseconds, so no separate datetime parsing is needed
     timestamp: datetime.datetime
     price_including_spread: float
     spread: float
 
+    # rename the side specific spread keys from the API to the generic field names
+    @model_validator(mode="before")
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "EstimatedOrderPrice":
-        if data["side"] == "bid":
-            price_including_spread_key = "bid_inclusive_of_sell_spread"
-            spread_key = "sell_spread"
-        else:
-            price_including_spread_key = "ask_inclusive_of_buy_spread"
-            spread_key = "buy_spread"
-        # Parse the timestamp using dateutil.parser.parse, which can handle the timezone and extended fractional seconds
-        timestamp = parser.parse(data["timestamp"])
-        return cls(
-            symbol=data["symbol"],
-            price=float(data["price"]),
-            quantity=float(data["quantity"]),
-            side=data["side"],
-            timestamp=timestamp,
-            price_including_spread=float(data[price_including_spread_key]),
-            spread=float(data[spread_key]),
-        )
+    def map_spread_keys(cls, data: Any) -> Any:
+        if not isinstance(data, dict) or "price_including_spread" in data:
+            return data
+        spread_keys = _SPREAD_KEYS.get(data.get("side"))
+        # raised as a ValueError so pydantic reports it as a ValidationError
+        if spread_keys is None:
+            raise ValueError(f"Unknown side {data.get('side')!r}, expected one of {list(_SPREAD_KEYS)}")
+        price_including_spread_key, spread_key = spread_keys
+        data = dict(data)
+        # missing spread keys are left for field validation to report
+        if price_including_spread_key in data:
+            data["price_including_spread"] = data.pop(price_including_spread_key)
+        if spread_key in data:
+            data["spread"] = data.pop(spread_key)
+        return data
 
 class EstimatedBidAndAskPrice(BaseModel):
     bid: EstimatedOrderPrice
     ask: EstimatedOrderPrice
     timestamp: datetime.datetime
 
+    # default the timestamp to the bid's timestamp when it isn't given
+    @model_validator(mode="before")
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "EstimatedBidAndAskPrice":
-        bid = EstimatedOrderPrice.from_dict(data["bid"])
-        ask = EstimatedOrderPrice.from_dict(data["ask"])
-        # raise error if the timestamps of the bid and ask are not the same
-        if bid.timestamp != ask.timestamp:
+    def default_timestamp(cls, data: Any) -> Any:
+        if not isinstance(data, dict) or "timestamp" in data:
+            return data
+        bid = data["bid"]
+        return {**data, "timestamp": bid["timestamp"] if isinstance(bid, dict) else bid.timestamp}
+
+    # raise error if the timestamps of the bid and ask are not the same
+    @model_validator(mode="after")
+    def check_timestamps_match(self) -> "EstimatedBidAndAskPrice":
+        if self.bid.timestamp != self.ask.timestamp:
             raise ValueError("Bid and ask timestamps must match")
-        timestamp = bid.timestamp
+        return self
 
-        return cls(bid=bid, ask=ask, timestamp=timestamp)
-    
     @classmethod
     def from_objs(cls, bid: EstimatedOrderPrice, ask: EstimatedOrderPrice) -> "EstimatedBidAndAskPrice":
         if bid.timestamp != ask.timestamp:
             raise ValueError("Bid and ask timestamps must match")
         timestamp = bid.timestamp
 
-        return cls(bid=bid, ask=ask, timestamp=timestamp)
+        return cls.model_construct(bid=bid, ask=ask, timestamp=timestamp)
 
 class EstimatedOrderPriceHistoryEntry(BaseModel):
     """
@@ -138,7 +148,7 @@ class EstimatedOrderPriceHistoryEntry(BaseModel):
 
     @classmethod
     def from_obj(cls, data: EstimatedBidAndAskPrice) -> "EstimatedOrderPriceHistoryEntry":
-        return cls(
+        return cls.model_construct(
             symbol=data.bid.symbol,
             bid_price=data.bid.price,
             bid_quantity=data.bid.quantity,
@@ -157,7 +167,7 @@ class EstimatedOrderPriceHistoryEntry(BaseModel):
 
     @classmethod
     def from_objs(cls, bid: EstimatedOrderPrice, ask: EstimatedOrderPrice) -> "EstimatedOrderPriceHistoryEntry":
-        return cls(
+        return cls.model_construct(
             symbol=bid.symbol,
             bid_price=bid.price,
             bid_quantity=bid.quantity,
@@ -176,27 +186,54 @@ class EstimatedOrderPriceHistoryEntry(BaseModel):
 
     
 
+# memoize a method returning a list of pydantic models in redis, keyed on the method name and its
+# arguments (excluding self) so the cached result is shared between all instances and processes
+def redis_memoize(model: type, expire: int) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            key = orjson.dumps([func.__qualname__, args])
+            # redis is only an optimization, so fall back to calling func directly if it's unavailable
+            try:
+                cached = redis_client.get(key)
+            except redis.RedisError as e:
+                print(f"Error reading from redis cache: {e}")
+                return func(self, *args)
+            if cached is not None:
+                return [model.model_validate(data) for data in orjson.loads(cached)]
+            result = func(self, *args)
+            try:
+                redis_client.setex(key, expire, orjson.dumps([item.model_dump() for item in result]))
+            except redis.RedisError as e:
+                print(f"Error writing to redis cache: {e}")
+            return result
+        return wrapper
+    return decorator
+
+
 class CryptoAPITrading:
     def __init__(self):
         self.api_key = API_KEY
+        # pre-encode the api key once since it prefixes every signed message
+        self.api_key_bytes = API_KEY.encode("utf-8")
         private_key_seed = base64.b64decode(BASE64_PRIVATE_KEY)
-        self.private_key = SigningKey(private_key_seed)
+        # use OpenSSL's Ed25519 implementation via cryptography for faster signing
+        self.private_key = Ed25519PrivateKey.from_private_bytes(private_key_seed)
         self.base_url = "https://trading.robinhood.com"
+        # reuse one session so connections are pooled and kept alive across requests
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+        # in-memory cache of trading pairs by symbol, layered in front of the redis cache
+        self._tp_cache: Dict[str, TradingPair] = {}
 
     @staticmethod
     def _get_current_timestamp() -> int:
-        return int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
+        # time.time() is seconds since the epoch, which is always UTC
+        return int(time.time())
 
     @staticmethod
     def get_query_params(key: str, *args: Optional[str]) -> str:
-        if not args:
-            return ""
-
-        params = []
-        for arg in args:
-            params.append(f"{key}={arg}")
-
-        return "?" + "&".join(params)
+        return "?" + "&".join(f"{key}={arg}" for arg in args) if args else ""
 
     def make_api_request(self, method: str, path: str, body: str = "") -> Any:
         timestamp = self._get_current_timestamp()
@@ -206,26 +243,35 @@ class CryptoAPITrading:
         try:
             response = {}
             if method == "GET":
-                response = requests.get(url, headers=headers, timeout=10)
+                response = self.session.get(url, headers=headers, timeout=10)
             elif method == "POST":
-                response = requests.post(url, headers=headers, json=json.loads(body), timeout=10)
+                # send the already serialized body as-is so the payload matches the signed message
+                headers["Content-Type"] = "application/json"
+                response = self.session.post(url, headers=headers, data=body, timeout=10)
             if response.status_code >= 400:
                 print(f"Error making API request: {response.text}")
                 return None
-            return response.json()
-        except requests.RequestException as e:
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error making API request: {e}")
             return None
 
     def get_authorization_header(
             self, method: str, path: str, body: str, timestamp: int
     ) -> Dict[str, str]:
-        message_to_sign = f"{self.api_key}{timestamp}{path}{method}{body}"
-        signed = self.private_key.sign(message_to_sign.encode("utf-8"))
+        message_to_sign = b"".join([
+            self.api_key_bytes,
+            str(timestamp).encode("utf-8"),
+            path.encode("utf-8"),
+            method.encode("utf-8"),
+            body.encode("utf-8"),
+        ])
+        # cryptography returns the raw 64-byte signature directly
+        signature = self.private_key.sign(message_to_sign)
 
         return {
             "x-api-key": self.api_key,
-            "x-signature": base64.b64encode(signed.signature).decode("utf-8"),
+            "x-signature": base64.b64encode(signature).decode("utf-8"),
             "x-timestamp": str(timestamp),
         }
 
@@ -235,14 +281,32 @@ class CryptoAPITrading:
 
     # The symbols argument must be formatted in trading pairs, e.g "BTC-USD", "ETH-USD". If no symbols are provided,
     # all supported symbols will be returned
-    # use disk cache and cache the results for 1 day
-    @cache.memoize(expire=86400)
+    # use redis cache and cache the results for 1 day
+    @redis_memoize(TradingPair, expire=86400)
     def get_trading_pairs(self, *symbols: Optional[str]) -> List[TradingPair]:
         print("Fetching trading pairs")
         query_params = self.get_query_params("symbol", *symbols)
         path = f"/api/v1/crypto/trading/trading_pairs/{query_params}"
         r = self.make_api_request("GET", path)["results"]
-        return [TradingPair.from_dict(data) for data in r]
+        return [TradingPair.model_validate(data) for data in r]
+
+    # Look up a single trading pair, checking the in-memory cache before falling back to
+    # the redis cached get_trading_pairs
+    def get_trading_pair(self, symbol: str) -> TradingPair:
+        tp = self._tp_cache.get(symbol)
+        if tp is None:
+            tp = self.get_trading_pairs(symbol)[0]
+            self._tp_cache[symbol] = tp
+        return tp
+
+    # Fetch the trading pairs for any symbols not already in the in-memory cache with a single request,
+    # so later get_trading_pair calls for them are dict lookups
+    def prefetch_trading_pairs(self, *symbols: str) -> None:
+        missing = [symbol for symbol in symbols if symbol not in self._tp_cache]
+        if not missing:
+            return
+        for tp in self.get_trading_pairs(*missing):
+            self._tp_cache[tp.symbol] = tp
 
     # The asset_codes argument must be formatted as the short form name for a crypto, e.g "BTC", "ETH". If no asset
     # codes are provided, all crypto holdings will be returned
@@ -264,7 +328,7 @@ class CryptoAPITrading:
     def get_estimated_price(self, symbol: str, side: str, quantity: str) -> List[EstimatedOrderPrice]:
         path = f"/api/v1/crypto/marketdata/estimated_price/?symbol={symbol}&side={side}&quantity={quantity}"
         r = self.make_api_request("GET", path).get("results")
-        return [EstimatedOrderPrice.from_dict(data) for data in r]
+        return [EstimatedOrderPrice.model_validate(data) for data in r]
 
     # Function for computing cost of buying a certain quantity of a crypto
     # The symbol argument must be formatted in a trading pair, e.g "BTC-USD", "ETH-USD"
@@ -276,14 +340,20 @@ class CryptoAPITrading:
         return self.get_estimated_price(symbol, "ask", quantity)[0]
 
     def get_quantity_of_crypto(self, symbol: str, price: float) -> float:
-        tp = self.get_trading_pairs(symbol)[0]
+        tp = self.get_trading_pair(symbol)
         r = self.get_estimated_bid_price(symbol, str(tp.min_order_size))
         return price / r.price
 
-    def get_current_estimated_price(self, symbol: str) -> EstimatedOrderPriceHistoryEntry:
-        both = self.get_estimated_price(symbol, "both", self.get_trading_pairs(symbol)[0].min_order_size)
-        bid = [x for x in both if x.side == "bid"][0]
-        ask = [x for x in both if x.side == "ask"][0]
+    # min_order_size can be passed in when it's already known to skip the trading pair lookup
+    def get_current_estimated_price(
+            self, symbol: str, min_order_size: Optional[float] = None
+    ) -> EstimatedOrderPriceHistoryEntry:
+        if min_order_size is None:
+            min_order_size = self.get_trading_pair(symbol).min_order_size
+        both = self.get_estimated_price(symbol, "both", min_order_size)
+        # the "both" side always returns exactly one bid and one ask
+        a, b = both
+        bid, ask = (a, b) if a.side == "bid" else (b, a)
         return EstimatedOrderPriceHistoryEntry.from_objs(bid=bid, ask=ask)
 
     def place_order(
@@ -302,7 +372,7 @@ class CryptoAPITrading:
             f"{order_type}_order_config": order_config,
         }
         path = "/api/v1/crypto/trading/orders/"
-        return self.make_api_request("POST", path, json.dumps(body))
+        return self.make_api_request("POST", path, orjson.dumps(body).decode("utf-8"))
 
     def cancel_order(self, order_id: str) -> Any:
         path = f"/api/v1/crypto/trading/orders/{order_id}/cancel/"
@@ -0,0 +1,17 @@
+from db import Collection, LatestPricesCollection
+
+# keep 30 days of price history, older entries are pruned automatically by mongo
+PRICE_HISTORY_TTL_SECONDS = 30 * 86400
+
+
+# one-time setup of the indexes used by price_history_analyzer.read_price_history and the
+# collector's latest_prices upserts
+def create_indexes():
+    Collection.create_index([("symbol", 1), ("timestamp", 1)])
+    Collection.create_index("timestamp", expireAfterSeconds=PRICE_HISTORY_TTL_SECONDS)
+    # unique so the per-symbol upserts use an index and concurrent collectors can't insert duplicate rows
+    LatestPricesCollection.create_index("symbol", unique=True)
+    print("Created MongoDB indexes")
+
+if __name__ == "__main__":
+    create_indexes()